@@ -0,0 +1,123 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+# Ahead-of-time compiled versions of the kernels in kernels.py
+# Build with: python setup.py build_ext --inplace
+import numpy as np
+from libc.stdint cimport int32_t, int64_t
+from libc.stdlib cimport qsort
+
+# Value arrays may be float32 or float64, independently for each operand
+ctypedef fused a_float:
+    float
+    double
+
+ctypedef fused b_float:
+    float
+    double
+
+
+cdef int _compare_int32(const void *x, const void *y) noexcept nogil:
+    cdef int32_t a = (<const int32_t *>x)[0]
+    cdef int32_t b = (<const int32_t *>y)[0]
+    return (a > b) - (a < b)
+
+
+def spgemm(const int64_t[::1] a_indptr, const int32_t[::1] a_indices, const a_float[::1] a_data,
+           const int64_t[::1] b_indptr, const int32_t[::1] b_indices, const b_float[::1] b_data,
+           Py_ssize_t n_cols):
+    # Multiply two CSR matrices with Gustavson's algorithm
+    # Same contract as kernels.spgemm: returns the product in CSR form
+    # (indptr, indices, data), rows sorted by column, cancelled entries kept
+    # as zeros; products are accumulated in double precision
+    cdef Py_ssize_t n_rows = a_indptr.shape[0] - 1
+    cdef Py_ssize_t i, k, kp, jp, j, n, t, start
+    cdef int64_t bound = 0
+
+    # Row i of the product has at most sum(nnz(B[k]) for k in A[i]) entries;
+    # output space is allocated once from the sum of these bounds
+    with nogil:
+        for kp in range(a_indptr[n_rows]):
+            k = a_indices[kp]
+            bound += b_indptr[k + 1] - b_indptr[k]
+
+    indices_arr = np.empty(bound, dtype=np.int32)
+    data_arr = np.empty(bound, dtype=np.float64)
+    indptr_arr = np.zeros(n_rows + 1, dtype=np.int64)
+    cdef int32_t[::1] indices = indices_arr
+    cdef double[::1] data = data_arr
+    cdef int64_t[::1] indptr = indptr_arr
+    # mark[j] == i means column j has already been seen in row i
+    cdef int64_t[::1] mark = np.full(n_cols, -1, dtype=np.int64)
+    cdef double[::1] acc = np.empty(n_cols, dtype=np.float64)
+    cdef double v
+
+    with nogil:
+        # Rows are processed in order, so each one is written straight after
+        # the previous row's entries and never outgrows the space reserved
+        for i in range(n_rows):
+            start = indptr[i]
+            n = 0
+            for kp in range(a_indptr[i], a_indptr[i + 1]):
+                k = a_indices[kp]
+                v = a_data[kp]
+                for jp in range(b_indptr[k], b_indptr[k + 1]):
+                    j = b_indices[jp]
+                    if mark[j] != i:
+                        mark[j] = i
+                        indices[start + n] = <int32_t>j
+                        n += 1
+                        acc[j] = v * b_data[jp]
+                    else:
+                        acc[j] += v * b_data[jp]
+            if n > 1:
+                qsort(&indices[start], n, sizeof(int32_t), _compare_int32)
+            for t in range(start, start + n):
+                data[t] = acc[indices[t]]
+            indptr[i + 1] = start + n
+
+    # Trim the unused tail of the preallocated space
+    return indptr_arr, indices_arr[:indptr[n_rows]], data_arr[:indptr[n_rows]]
+
+
+def merge_add(const int32_t[::1] a_rows, const int32_t[::1] a_cols, const a_float[::1] a_vals,
+              const int32_t[::1] b_rows, const int32_t[::1] b_cols, const b_float[::1] b_vals,
+              double sign):
+    # Compute A + sign * B for two COO matrices sorted by (row, col)
+    # Same contract as kernels.merge_add: sorted COO output, cancelled
+    # entries dropped, sums formed in double precision
+    cdef Py_ssize_t na = a_vals.shape[0], nb = b_vals.shape[0]
+    out_rows_arr = np.empty(na + nb, dtype=np.int32)
+    out_cols_arr = np.empty(na + nb, dtype=np.int32)
+    out_vals_arr = np.empty(na + nb, dtype=np.float64)
+    cdef int32_t[::1] out_rows = out_rows_arr
+    cdef int32_t[::1] out_cols = out_cols_arr
+    cdef double[::1] out_vals = out_vals_arr
+    cdef Py_ssize_t i = 0, j = 0, n = 0
+    cdef double total
+
+    with nogil:
+        while i < na and j < nb:
+            if a_rows[i] < b_rows[j] or (a_rows[i] == b_rows[j] and a_cols[i] < b_cols[j]):
+                out_rows[n], out_cols[n], out_vals[n] = a_rows[i], a_cols[i], a_vals[i]
+                i += 1
+                n += 1
+            elif a_rows[i] == b_rows[j] and a_cols[i] == b_cols[j]:
+                total = <double>a_vals[i] + sign * <double>b_vals[j]
+                if total != 0:
+                    out_rows[n], out_cols[n], out_vals[n] = a_rows[i], a_cols[i], total
+                    n += 1
+                i += 1
+                j += 1
+            else:
+                out_rows[n], out_cols[n], out_vals[n] = b_rows[j], b_cols[j], sign * <double>b_vals[j]
+                j += 1
+                n += 1
+        while i < na:
+            out_rows[n], out_cols[n], out_vals[n] = a_rows[i], a_cols[i], a_vals[i]
+            i += 1
+            n += 1
+        while j < nb:
+            out_rows[n], out_cols[n], out_vals[n] = b_rows[j], b_cols[j], sign * <double>b_vals[j]
+            j += 1
+            n += 1
+
+    return out_rows_arr[:n], out_cols_arr[:n], out_vals_arr[:n]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Checks that every available backend (C extension, Numba, SciPy, NumPy)
+gives the same results, including for inf and nan values:
+
+    python check_backends.py
+
+Results are compared exactly against plain dictionary arithmetic.
+"""
+import sys
+from contextlib import ExitStack
+from itertools import product
+from unittest import mock
+
+import numpy as np
+
+import kernels
+import operations
+from matrix_core import NARROW_VALUE_DTYPE, VALUE_DTYPE, SparseMatrix
+
+# Small integers keep every sum exact whatever the order of accumulation;
+# inf, -inf and nan exercise the non-finite paths (inf - inf gives nan)
+VALUES = [-3, -2, -1, 1, 2, 3, np.inf, -np.inf, np.nan]
+
+
+def backends():
+    """Yield (name, patches) for each backend that can run here"""
+    # Patches on the module globals that operations dispatches on
+    if operations._sparse_ops is not None:
+        yield "C extension", {(kernels, 'N_THREADS'): 1}
+    if kernels.HAS_NUMBA:
+        yield "Numba", {(operations, '_sparse_ops'): None, (kernels, 'N_THREADS'): 1}
+        yield "Numba parallel", {(operations, '_sparse_ops'): None, (kernels, 'N_THREADS'): 2,
+                                 (kernels, 'PARALLEL_MERGE_MIN_NNZ'): 0}
+    if operations._HAS_SCIPY:
+        yield "SciPy", {(operations, '_sparse_ops'): None, (kernels, 'HAS_NUMBA'): False,
+                        (operations, 'SCIPY_MIN_NNZ'): 0}
+    yield "NumPy", {(operations, '_sparse_ops'): None, (kernels, 'HAS_NUMBA'): False,
+                    (operations, '_HAS_SCIPY'): False}
+
+
+def random_entries(rng, rows, cols, density):
+    """Random {(row, col): value} entries drawn from VALUES"""
+    return {(i, j): float(rng.choice(VALUES))
+            for i, j in product(range(rows), range(cols)) if rng.random() < density}
+
+
+def to_matrix(rows, cols, entries, dtype):
+    """Build a SparseMatrix from {(row, col): value} entries"""
+    keys = list(entries)
+    return SparseMatrix.from_arrays(rows, cols, [k[0] for k in keys], [k[1] for k in keys],
+                                    [entries[k] for k in keys], dtype=dtype)
+
+
+def reference(op, a, b):
+    """Compute op on {(row, col): value} entries with plain Python arithmetic"""
+    result = {}
+    if op == 'multiply':
+        for (i, k), x in a.items():
+            for (k2, j), y in b.items():
+                if k == k2:
+                    result[(i, j)] = result.get((i, j), 0.0) + x * y
+    else:
+        sign = 1 if op == 'add' else -1
+        result = dict(a)
+        for key, y in b.items():
+            result[key] = result.get(key, 0.0) + sign * y
+    # Cancelled entries are dropped; nan compares unequal to 0 and is kept
+    return {key: v for key, v in result.items() if v != 0}
+
+
+def same(matrix, expected):
+    """Whether a matrix holds exactly the expected entries, nan matching nan"""
+    got = {key: v for key, v in matrix.items()}
+    if got.keys() != expected.keys():
+        return False
+    return all(got[k] == v or (np.isnan(got[k]) and np.isnan(v)) for k, v in expected.items())
+
+
+def cases():
+    """Yield (op, a, b, shapes) test cases"""
+    # Overlapping non-finite entries whose sum is nan
+    a = {(0, 0): np.inf, (1, 1): np.nan}
+    b = {(0, 0): -np.inf, (0, 1): 3.0}
+    yield 'add', a, b, ((2, 2), (2, 2))
+    yield 'subtract', a, a, ((2, 2), (2, 2))
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        n, m, p = rng.integers(1, 12, 3)
+        a = random_entries(rng, n, m, 0.4)
+        for op in ('add', 'subtract'):
+            yield op, a, random_entries(rng, n, m, 0.4), ((n, m), (n, m))
+        yield 'multiply', a, random_entries(rng, m, p, 0.4), ((n, m), (m, p))
+
+
+def main():
+    failures = 0
+    for name, patches in backends():
+        mismatches = 0
+        with ExitStack() as stack:
+            for (module, attr), value in patches.items():
+                stack.enter_context(mock.patch.object(module, attr, value))
+            # inf - inf is expected here; NumPy would warn about it
+            stack.enter_context(np.errstate(invalid='ignore'))
+            for (op, a, b, (shape_a, shape_b)), dtype in product(cases(), (VALUE_DTYPE, NARROW_VALUE_DTYPE)):
+                result = getattr(operations, op)(to_matrix(*shape_a, a, dtype), to_matrix(*shape_b, b, dtype))
+                if not same(result, reference(op, a, b)):
+                    mismatches += 1
+        print(f"{name}: {'ok' if mismatches == 0 else f'{mismatches} mismatches'}")
+        failures += mismatches
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
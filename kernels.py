@@ -0,0 +1,201 @@
+import numpy as np
+
+# Numba is optional: without it these kernels are never called and the
+# operations fall back to their NumPy implementations
+try:
+    from numba import config, njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+    prange = range
+
+N_THREADS = config.NUMBA_NUM_THREADS if HAS_NUMBA else 1
+# Work is split into a few blocks per thread to even out uneven rows
+N_BLOCKS = 4 * N_THREADS
+# Below this many input entries merge_add_parallel costs more than it saves
+PARALLEL_MERGE_MIN_NNZ = 100_000
+
+
+@njit(parallel=True, fastmath=True, boundscheck=False, cache=True)
+def spgemm(a_indptr, a_indices, a_data, b_indptr, b_indices, b_data, n_cols):
+    # Multiply two CSR matrices with Gustavson's algorithm
+    # Output rows are independent, so the work runs in parallel over blocks
+    # of rows; each block reuses one dense accumulator and one marker array
+    # for all of its rows instead of allocating them per row
+    # Compiled separately for float32 and float64 inputs; products are always
+    # accumulated in float64
+    # Returns the product in CSR form (indptr, indices, data), rows sorted
+    # by column; entries whose products cancel out are kept as zeros
+    n_rows = len(a_indptr) - 1
+    n_blocks = min(n_rows, N_BLOCKS)
+
+    # Row i of the product has at most sum(nnz(B[k]) for k in A[i]) entries;
+    # output space is allocated once from these bounds
+    bound = np.zeros(n_rows + 1, dtype=np.int64)
+    for i in range(n_rows):
+        n = 0
+        for kp in range(a_indptr[i], a_indptr[i + 1]):
+            k = a_indices[kp]
+            n += b_indptr[k + 1] - b_indptr[k]
+        bound[i + 1] = bound[i] + n
+    buf_indices = np.empty(bound[n_rows], dtype=np.int32)
+    buf_data = np.empty(bound[n_rows], dtype=np.float64)
+    counts = np.zeros(n_rows, dtype=np.int64)
+
+    # Numeric pass: mark[j] == i means column j has already been seen in
+    # row i, so the marker never needs clearing between rows; touched
+    # columns are collected in the row's slot and the first product to reach
+    # a column overwrites the accumulator, so only touched entries are written
+    for block in prange(n_blocks):
+        acc = np.empty(n_cols, dtype=np.float64)
+        mark = np.full(n_cols, -1, dtype=np.int64)
+        for i in range(block * n_rows // n_blocks, (block + 1) * n_rows // n_blocks):
+            start = bound[i]
+            nt = 0
+            for kp in range(a_indptr[i], a_indptr[i + 1]):
+                k = a_indices[kp]
+                v = np.float64(a_data[kp])  # Accumulate in double precision
+                for jp in range(b_indptr[k], b_indptr[k + 1]):
+                    j = b_indices[jp]
+                    if mark[j] != i:
+                        mark[j] = i
+                        buf_indices[start + nt] = j
+                        nt += 1
+                        acc[j] = v * b_data[jp]
+                    else:
+                        acc[j] += v * b_data[jp]
+            buf_indices[start:start + nt].sort()
+            for t in range(start, start + nt):
+                buf_data[t] = acc[buf_indices[t]]
+            counts[i] = nt
+
+    # Trim: move each row from its slot to its final position
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(counts)
+    if indptr[n_rows] == bound[n_rows]:
+        return indptr, buf_indices, buf_data
+    indices = np.empty(indptr[n_rows], dtype=np.int32)
+    data = np.empty(indptr[n_rows], dtype=np.float64)
+    for block in prange(n_blocks):
+        for i in range(block * n_rows // n_blocks, (block + 1) * n_rows // n_blocks):
+            src, dst = bound[i], indptr[i]
+            indices[dst:dst + counts[i]] = buf_indices[src:src + counts[i]]
+            data[dst:dst + counts[i]] = buf_data[src:src + counts[i]]
+
+    return indptr, indices, data
+
+
+@njit(boundscheck=False, cache=True)
+def _merge_range(a_rows, a_cols, a_vals, i, na, b_rows, b_cols, b_vals, j, nb, sign,
+                 out_rows, out_cols, out_vals, n):
+    # Merge A[i:na] + sign * B[j:nb] into the output arrays starting at n
+    # Returns the output position after the last entry written
+    while i < na and j < nb:
+        if a_rows[i] < b_rows[j] or (a_rows[i] == b_rows[j] and a_cols[i] < b_cols[j]):
+            out_rows[n], out_cols[n], out_vals[n] = a_rows[i], a_cols[i], a_vals[i]
+            i += 1
+            n += 1
+        elif a_rows[i] == b_rows[j] and a_cols[i] == b_cols[j]:
+            total = np.float64(a_vals[i]) + sign * np.float64(b_vals[j])
+            if total != 0:
+                out_rows[n], out_cols[n], out_vals[n] = a_rows[i], a_cols[i], total
+                n += 1
+            i += 1
+            j += 1
+        else:
+            out_rows[n], out_cols[n], out_vals[n] = b_rows[j], b_cols[j], sign * b_vals[j]
+            j += 1
+            n += 1
+    while i < na:
+        out_rows[n], out_cols[n], out_vals[n] = a_rows[i], a_cols[i], a_vals[i]
+        i += 1
+        n += 1
+    while j < nb:
+        out_rows[n], out_cols[n], out_vals[n] = b_rows[j], b_cols[j], sign * b_vals[j]
+        j += 1
+        n += 1
+    return n
+
+
+@njit(boundscheck=False, cache=True)
+def merge_add(a_rows, a_cols, a_vals, b_rows, b_cols, b_vals, sign):
+    # Compute A + sign * B for two COO matrices sorted by (row, col) with a
+    # single two-pointer merge, like merging two sorted lists
+    # Returns the result as sorted COO arrays with cancelled entries dropped;
+    # sums are formed in float64 whatever the input value dtype
+    na, nb = len(a_vals), len(b_vals)
+    out_rows = np.empty(na + nb, dtype=np.int32)
+    out_cols = np.empty(na + nb, dtype=np.int32)
+    out_vals = np.empty(na + nb, dtype=np.float64)
+    n = _merge_range(a_rows, a_cols, a_vals, 0, na, b_rows, b_cols, b_vals, 0, nb, sign,
+                     out_rows, out_cols, out_vals, 0)
+    return out_rows[:n], out_cols[:n], out_vals[:n]
+
+
+@njit(boundscheck=False, cache=True)
+def _lower_bound(rows, cols, row, col):
+    # Index of the first entry of a (row, col)-sorted COO not less than (row, col)
+    lo, hi = 0, len(rows)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if rows[mid] < row or (rows[mid] == row and cols[mid] < col):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+@njit(boundscheck=False, cache=True)
+def _split_points(x_rows, x_cols, y_rows, y_cols, n_blocks):
+    # Cut X into n_blocks equal runs and cut Y at the same (row, col) keys,
+    # so that block c of X and block c of Y cover the same key range
+    nx = len(x_rows)
+    x_split = np.empty(n_blocks + 1, dtype=np.int64)
+    y_split = np.empty(n_blocks + 1, dtype=np.int64)
+    x_split[0] = y_split[0] = 0
+    x_split[n_blocks], y_split[n_blocks] = nx, len(y_rows)
+    for c in range(1, n_blocks):
+        x_split[c] = c * nx // n_blocks
+        y_split[c] = _lower_bound(y_rows, y_cols, x_rows[x_split[c]], x_cols[x_split[c]])
+    return x_split, y_split
+
+
+@njit(parallel=True, boundscheck=False, cache=True)
+def merge_add_parallel(a_rows, a_cols, a_vals, b_rows, b_cols, b_vals, sign):
+    # Parallel version of merge_add with the same contract
+    # The key range is cut into blocks by splitting the larger operand evenly
+    # and the other at the same keys; each block is merged independently into
+    # its own slice of the output, and the slices are then packed together
+    na, nb = len(a_vals), len(b_vals)
+    n_blocks = max(1, min(N_BLOCKS, max(na, nb)))
+    if na >= nb:
+        a_split, b_split = _split_points(a_rows, a_cols, b_rows, b_cols, n_blocks)
+    else:
+        b_split, a_split = _split_points(b_rows, b_cols, a_rows, a_cols, n_blocks)
+
+    buf_rows = np.empty(na + nb, dtype=np.int32)
+    buf_cols = np.empty(na + nb, dtype=np.int32)
+    buf_vals = np.empty(na + nb, dtype=np.float64)
+    counts = np.empty(n_blocks, dtype=np.int64)
+    for c in prange(n_blocks):
+        start = a_split[c] + b_split[c]
+        end = _merge_range(a_rows, a_cols, a_vals, a_split[c], a_split[c + 1],
+                           b_rows, b_cols, b_vals, b_split[c], b_split[c + 1], sign,
+                           buf_rows, buf_cols, buf_vals, start)
+        counts[c] = end - start
+
+    offsets = np.zeros(n_blocks + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    out_rows = np.empty(offsets[n_blocks], dtype=np.int32)
+    out_cols = np.empty(offsets[n_blocks], dtype=np.int32)
+    out_vals = np.empty(offsets[n_blocks], dtype=np.float64)
+    for c in prange(n_blocks):
+        src, dst, n = a_split[c] + b_split[c], offsets[c], counts[c]
+        out_rows[dst:dst + n] = buf_rows[src:src + n]
+        out_cols[dst:dst + n] = buf_cols[src:src + n]
+        out_vals[dst:dst + n] = buf_vals[src:src + n]
+    return out_rows, out_cols, out_vals
@@ -8,7 +8,7 @@ import datetime
 import json
 import time
 from typing import Optional
-from matrix_io import parse_matrix_file, write_matrix_to_file, write_matrix_to_json
+from matrix_io import parse_matrix_file, sorted_entries, write_matrix_to_file, write_matrix_to_json
 from operations import add, subtract, multiply
 
 # Configuration
@@ -57,9 +57,8 @@ def save_result_with_summary(result, operation, matrix1_path, matrix2_path, m1,
     with open(summary_path, 'w') as f:
         # Write header with brackets
         f.write(f"[{result.rows} {result.cols}]\n")
-        # Write each non-zero entry with brackets
-        for (row, col), val in sorted(result.items()):
-            f.write(f"[{row} {col} {val}]\n")
+        # Write each non-zero entry with brackets, in (row, col) order
+        f.write("".join(f"[{row} {col} {val}]\n" for row, col, val in sorted_entries(result)))
 
     return summary_path
 
@@ -101,8 +100,8 @@ def main():
         load_time = time.time() - start_time
         
         print(f"Matrices loaded in {load_time:.4f} seconds")
-        print(f"Matrix 1: {m1.rows}x{m1.cols} with {len(list(m1.items()))} non-zero elements")
-        print(f"Matrix 2: {m2.rows}x{m2.cols} with {len(list(m2.items()))} non-zero elements")
+        print(f"Matrix 1: {m1.rows}x{m1.cols} with {len(m1)} non-zero elements")
+        print(f"Matrix 2: {m2.rows}x{m2.cols} with {len(m2)} non-zero elements")
         
         # Validate operation
         if choice in ('1', '2') and (m1.rows != m2.rows or m1.cols != m2.cols):
@@ -117,7 +116,7 @@ def main():
         op_time = time.time() - start_time
         
         print(f"Operation completed in {op_time:.4f} seconds")
-        print(f"Result: {result.rows}x{result.cols} with {len(list(result.items()))} non-zero elements")
+        print(f"Result: {result.rows}x{result.cols} with {len(result)} non-zero elements")
         
         # Save the result with summary information
         summary_path = save_result_with_summary(result, op_name, path1, path2, m1, m2, SAMPLE_FOLDER)
@@ -1,29 +1,203 @@
+import numpy as np
+
+INDEX_DTYPE = np.int32
+VALUE_DTYPE = np.float64
+# Compact storage for values that float32 represents exactly
+NARROW_VALUE_DTYPE = np.float32
+
+
+def narrow_dtype(values):
+    # Pick float32 storage when every value survives the conversion
+    # unchanged, halving the memory traffic of later passes; float64 otherwise
+    # Values beyond float32's range become inf and fail the comparison, so
+    # the overflow in the cast is expected and not reported
+    with np.errstate(over='ignore'):
+        if np.array_equal(values.astype(NARROW_VALUE_DTYPE), values):
+            return NARROW_VALUE_DTYPE
+    return VALUE_DTYPE
+
+
+def coo_order(row_idx, col_idx):
+    # Permutation that sorts COO entries by (row, col)
+    # Indices are non-negative int32 (SparseMatrix caps its dimensions at the
+    # int32 maximum and set() checks bounds), so (row << 32) | col packs each
+    # pair into one uint64 key with the same order; a stable argsort over a single
+    # integer key is much cheaper than np.lexsort over two
+    keys = (row_idx.astype(np.uint64) << np.uint64(32)) | col_idx.astype(np.uint64)
+    return np.argsort(keys, kind='stable')
+
+
 class SparseMatrix:
-    def __init__(self, rows, cols):
+    def __init__(self, rows, cols, dtype=VALUE_DTYPE):
         # Initialize a sparse matrix with specified dimensions
-        # Only non-zero elements will be stored in the data dictionary
+        # Non-zero elements are stored as three parallel arrays (COO layout):
+        # row indices, column indices and values, of which the first
+        # `size` slots are in use
+        # is_sorted records whether the entries are in (row, col) order
+        # Values are float64 unless a narrower dtype is requested
+        # Dimensions are capped so that every index fits INDEX_DTYPE
+        if rows > np.iinfo(INDEX_DTYPE).max or cols > np.iinfo(INDEX_DTYPE).max:
+            raise ValueError(f"Matrix dimensions exceed the supported maximum of {np.iinfo(INDEX_DTYPE).max}.")
         self.rows = rows
         self.cols = cols
-        self.data = {}
+        self.rows_arr = np.empty(0, dtype=INDEX_DTYPE)
+        self.cols_arr = np.empty(0, dtype=INDEX_DTYPE)
+        self.vals = np.empty(0, dtype=dtype)
+        self.size = 0
+        self.is_sorted = True
+
+    @classmethod
+    def from_arrays(cls, rows, cols, row_idx, col_idx, values, canonical=False,
+                    dtype=VALUE_DTYPE):
+        # Build a matrix directly from COO arrays
+        # Indices are assumed to be within bounds
+        # Unless the caller guarantees canonical input (sorted by (row, col),
+        # no duplicates, no zeros), duplicates are resolved with the last
+        # value winning, like repeated set() calls, zeros are dropped and the
+        # entries are sorted
+        matrix = cls(rows, cols, dtype)
+        row_idx = np.asarray(row_idx, dtype=INDEX_DTYPE)
+        col_idx = np.asarray(col_idx, dtype=INDEX_DTYPE)
+        values = np.asarray(values, dtype=dtype)
+        if not canonical and len(values):
+            keys = row_idx.astype(np.int64) * cols + col_idx
+            # Reversed so np.unique picks the last occurrence of each key
+            _, last = np.unique(keys[::-1], return_index=True)
+            keep = len(keys) - 1 - last
+            keep = keep[values[keep] != 0]
+            row_idx, col_idx, values = row_idx[keep], col_idx[keep], values[keep]
+        matrix.rows_arr = row_idx
+        matrix.cols_arr = col_idx
+        matrix.vals = values
+        matrix.size = len(values)
+        return matrix
+
+    def __len__(self):
+        # Number of stored non-zero elements
+        return self.size
+
+    @property
+    def nnz(self):
+        # Number of stored non-zero elements
+        return self.size
+
+    def _find(self, row, col):
+        # Locate the slot holding (row, col), or -1 if it is not stored
+        n = self.size
+        hits = np.where((self.rows_arr[:n] == row) & (self.cols_arr[:n] == col))[0]
+        return int(hits[0]) if len(hits) else -1
+
+    def _grow(self):
+        # Double the capacity of the backing arrays (amortized O(1) appends)
+        capacity = max(8, 2 * len(self.vals))
+        self.rows_arr = np.resize(self.rows_arr, capacity)
+        self.cols_arr = np.resize(self.cols_arr, capacity)
+        self.vals = np.resize(self.vals, capacity)
 
     def set(self, row, col, value):
         # Set a value at the specified position
         # Validates indices are within bounds
         # Only stores non-zero values to save memory
         # Removes entries when set to zero
+        # Updating or removing an existing entry scans the stored entries
+        # (O(nnz)); appending past the last entry of sorted storage skips the
+        # scan, so filling a matrix in (row, col) order is amortized O(1)
         if row < 0 or col < 0 or row >= self.rows or col >= self.cols:
             raise IndexError("Index out of bounds.")
-        if value != 0:
-            self.data[(row, col)] = value
-        elif (row, col) in self.data:
-            del self.data[(row, col)]
+        if value != 0 and self.vals.dtype != VALUE_DTYPE:
+            # Widen narrow storage instead of rounding the new value; values
+            # beyond float32's range overflow to inf in the probe, which is
+            # expected, as in narrow_dtype
+            with np.errstate(over='ignore'):
+                narrowed = float(self.vals.dtype.type(value))
+            if narrowed != value:
+                self.vals = self.vals.astype(VALUE_DTYPE)
+        n = self.size
+        if n == 0 or (self.is_sorted and (row, col) > (self.rows_arr[n - 1], self.cols_arr[n - 1])):
+            # The key is past every stored entry, so it cannot be stored yet
+            slot = -1
+        else:
+            slot = self._find(row, col)
+        if slot >= 0:
+            if value != 0:
+                self.vals[slot] = value
+            else:
+                # Shift the following entries down, keeping their order
+                self.rows_arr[slot:n - 1] = self.rows_arr[slot + 1:n]
+                self.cols_arr[slot:n - 1] = self.cols_arr[slot + 1:n]
+                self.vals[slot:n - 1] = self.vals[slot + 1:n]
+                self.size = n - 1
+        elif value != 0:
+            if n == len(self.vals):
+                self._grow()
+            if n and (row, col) < (self.rows_arr[n - 1], self.cols_arr[n - 1]):
+                self.is_sorted = False
+            self.rows_arr[self.size] = row
+            self.cols_arr[self.size] = col
+            self.vals[self.size] = value
+            self.size += 1
 
     def get(self, row, col):
         # Retrieve value at specified position
         # Returns 0 for positions not explicitly set (sparse matrix default)
-        return self.data.get((row, col), 0)
+        # Linear scan over the stored entries; meant for spot checks, not
+        # for use inside operations
+        slot = self._find(row, col)
+        return self.vals[slot].item() if slot >= 0 else 0
+
+    def as_arrays(self):
+        # Return the (row indices, column indices, values) arrays
+        # trimmed to the entries in use
+        n = self.size
+        return self.rows_arr[:n], self.cols_arr[:n], self.vals[:n]
+
+    def to_sorted(self):
+        # Sort the stored entries by (row, col) in place
+        # Only does work the first time after entries were appended out of order
+        if not self.is_sorted:
+            rows, cols, vals = self.as_arrays()
+            order = coo_order(rows, cols)
+            self.rows_arr, self.cols_arr, self.vals = rows[order], cols[order], vals[order]
+            self.is_sorted = True
+        return self
+
+    def to_csr(self):
+        # Convert to compressed sparse row form (indptr, indices, data)
+        # Row i occupies indices[indptr[i]:indptr[i + 1]], sorted by column
+        rows, cols, vals = self.to_sorted().as_arrays()
+        indptr = np.zeros(self.rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.rows), out=indptr[1:])
+        return indptr, cols, vals
+
+    @classmethod
+    def from_csr(cls, rows, cols, indptr, indices, data):
+        # Build a matrix from CSR arrays whose rows are sorted by column
+        # Explicit zeros (e.g. from cancelling products) are dropped
+        row_idx = np.repeat(np.arange(rows, dtype=INDEX_DTYPE), np.diff(indptr))
+        keep = data != 0
+        return cls.from_arrays(rows, cols, row_idx[keep], indices[keep], data[keep],
+                               canonical=True)
+
+    def to_scipy(self):
+        # Convert to a scipy.sparse CSR matrix (requires SciPy)
+        import scipy.sparse as sps
+        indptr, indices, data = self.to_csr()
+        return sps.csr_matrix((data, indices, indptr), shape=(self.rows, self.cols))
+
+    @classmethod
+    def from_scipy(cls, matrix):
+        # Build a matrix from any scipy.sparse matrix
+        csr = matrix.tocsr()
+        if not csr.has_canonical_format:
+            # Sort column indices and merge duplicates, leaving the input untouched
+            csr = csr.copy()
+            csr.sum_duplicates()
+        rows, cols = csr.shape
+        return cls.from_csr(rows, cols, csr.indptr, csr.indices, csr.data)
 
     def items(self):
-        # Return all non-zero elements as (position, value) pairs
-        # Used for efficient iteration over non-zero elements
-        return self.data.items()
+        # Yield all non-zero elements as ((row, col), value) pairs
+        # Kept for callers that iterate entry by entry
+        rows, cols, vals = self.as_arrays()
+        for row, col, val in zip(rows.tolist(), cols.tolist(), vals.tolist()):
+            yield (row, col), val
@@ -1,34 +1,70 @@
+import mmap
 import os
+import re
 import json
-from typing import Dict, Tuple
-from matrix_core import SparseMatrix
+import numpy as np
+from typing import Dict, List, Tuple
+from matrix_core import SparseMatrix, narrow_dtype
 
-def parse_matrix_file(file_path: str) -> SparseMatrix:
-    """Parse matrix file with enhanced validation and error reporting"""
-    try:
-        with open(file_path, 'r') as f:
-            lines = [line.strip() for line in f if line.strip()]
-    except FileNotFoundError:
-        raise ValueError(f"File not found: {file_path}")
-    except Exception as e:
-        raise ValueError(f"Error reading file: {str(e)}")
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-    # Validate header format
-    if len(lines) < 2 or not lines[0].startswith("rows=") or not lines[1].startswith("cols="):
-        raise ValueError("Invalid file format: missing rows/cols declaration")
+# One "(row, col, value)" entry per line; the fields are converted (and
+# thereby validated) by NumPy
+# Surrounding whitespace is what bytes.strip() removes, as for the header
+ENTRY_PATTERN = re.compile(rb'^[ \t\r\v\f]*\(([^,()\n]*),([^,()\n]*),([^,()\n]*)\)[ \t\r\v\f]*$', re.M)
+BLANK_LINE_PATTERN = re.compile(rb'^[ \t\r\v\f]*$', re.M)
+ENTRY_DTYPE = [('row', np.int64), ('col', np.int64), ('val', np.float64)]
+# Per-entry warnings printed for out-of-bounds indices before the rest are
+# only counted, so a malformed file cannot flood the console
+MAX_SKIP_WARNINGS = 10_000
+# Entries are parsed in windows of about this many bytes, ending on a line
+# break, so the Python objects built by the regex stay bounded
+PARSE_WINDOW_BYTES = 1024 * 1024
 
-    # Extract matrix dimensions
-    rows = int(lines[0].split("=")[1])
-    cols = int(lines[1].split("=")[1])
-    matrix = SparseMatrix(rows, cols)
-    
-    # Track statistics for reporting
-    total_entries = 0
-    skipped_entries = 0
-    out_of_bounds_indices = {}
+def _map_file(f):
+    """Memory-map an open file read-only (empty files cannot be mapped)"""
+    if os.fstat(f.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _read_header(buf) -> Tuple[List[str], int]:
+    """
+    Read the first two non-blank lines, which hold the rows=/cols= declarations.
     
-    # Parse each entry line
-    for line_num, line in enumerate(lines[2:], start=3):
+    Returns the header lines and the offset where the entries start.
+    """
+    header, pos = [], 0
+    while len(header) < 2 and pos < len(buf):
+        end = buf.find(b'\n', pos)
+        end = len(buf) if end < 0 else end + 1
+        line = buf[pos:end].strip()
+        if line:
+            header.append(line.decode(errors='replace'))
+        pos = end
+    return header, pos
+
+def _count_lines(buf, start: int, end: int) -> int:
+    """Count the lines in buf[start:end] (start must be inside the buffer)"""
+    newlines = np.frombuffer(buf, dtype=np.uint8, count=end - start, offset=start) == ord('\n')
+    return int(np.count_nonzero(newlines)) + 1
+
+def _parse_window(buf, start: int, end: int) -> np.ndarray:
+    """Parse the entries in buf[start:end], raising if a non-blank line does not match"""
+    entries = np.array(ENTRY_PATTERN.findall(buf, start, end), dtype=ENTRY_DTYPE)
+    if len(entries) != _count_lines(buf, start, end) - len(BLANK_LINE_PATTERN.findall(buf, start, end)):
+        raise ValueError("Unmatched entry lines")
+    return entries
+
+def _check_entry_lines(body: bytes, first_line: int = 3):
+    """Validate entry lines one by one, raising on the first malformed line"""
+    # Only used to produce a precise error once bulk parsing has failed
+    # Lines are numbered among the non-blank lines, from first_line
+    lines = [line for line in body.split(b'\n') if line.strip()]
+    for line_num, raw in enumerate(lines, start=first_line):
+        line = raw.strip().decode(errors='replace')
         if not (line.startswith('(') and line.endswith(')')):
             raise ValueError(f"Invalid format in line {line_num}: {line}")
         
@@ -37,71 +73,141 @@ def parse_matrix_file(file_path: str) -> SparseMatrix:
             raise ValueError(f"Expected 3 values in line {line_num}: {line}")
         
         try:
-            row, col = int(parts[0]), int(parts[1])
-            val = float(parts[2])
-            total_entries += 1
-            
-            if not (0 <= row < rows) or not (0 <= col < cols):
-                skipped_entries += 1
-                # Store pattern of out-of-bounds indices
-                key = f"({row}, {col})"
-                out_of_bounds_indices[key] = out_of_bounds_indices.get(key, 0) + 1
-                
-                print(f"⚠️ Skipping out-of-bounds index at line {line_num}: ({row}, {col}) - valid range is (0-{rows-1}, 0-{cols-1})")
-                continue
-                
-            matrix.set(row, col, val)
+            int(parts[0]), int(parts[1]), float(parts[2])
+        except ValueError:
+            raise ValueError(f"Non-numeric value in line {line_num}: {line}")
+        
+        # The bulk parser is stricter than the checks above: it needs the
+        # exact entry layout, fields NumPy can convert (ASCII digits, no
+        # inner spaces) and indices that fit in int64
+        match = ENTRY_PATTERN.fullmatch(raw)
+        if match is None:
+            raise ValueError(f"Invalid format in line {line_num}: {line}")
+        try:
+            np.array([match.groups()], dtype=ENTRY_DTYPE)
+        except OverflowError:
+            raise ValueError(f"Index out of supported range in line {line_num}: {line}")
         except ValueError:
             raise ValueError(f"Non-numeric value in line {line_num}: {line}")
 
+def parse_matrix_file(file_path: str) -> SparseMatrix:
+    """Parse matrix file with enhanced validation and error reporting"""
+    # The file is memory-mapped so that the entries are parsed straight from
+    # the page cache, without copying the contents into a Python string, and
+    # window by window so the regex matches never exist for the whole file
+    try:
+        with open(file_path, 'rb') as f:
+            buf = _map_file(f)
+    except FileNotFoundError:
+        raise ValueError(f"File not found: {file_path}")
+    except Exception as e:
+        raise ValueError(f"Error reading file: {str(e)}")
+
+    try:
+        header, pos = _read_header(buf)
+
+        # Validate header format
+        if len(header) < 2 or not header[0].startswith("rows=") or not header[1].startswith("cols="):
+            raise ValueError("Invalid file format: missing rows/cols declaration")
+
+        # Extract matrix dimensions
+        rows = int(header[0].split("=")[1])
+        cols = int(header[1].split("=")[1])
+        
+        # Parse the entries in bulk, one window at a time; if some non-blank
+        # line in a window did not match or a field is not a number, fall back
+        # to line-by-line validation of that window to report it
+        windows, parsed, start = [], 0, pos
+        while start < len(buf):
+            end = buf.find(b'\n', start + PARSE_WINDOW_BYTES)
+            end = len(buf) if end < 0 else end + 1
+            try:
+                windows.append(_parse_window(buf, start, end))
+            except (ValueError, OverflowError):
+                # Every earlier non-blank line was a valid entry
+                _check_entry_lines(buf[start:end], first_line=parsed + 3)
+                raise ValueError(f"Invalid file format: {file_path}")
+            parsed += len(windows[-1])
+            start = end
+        entries = np.concatenate(windows) if windows else np.empty(0, dtype=ENTRY_DTYPE)
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+    row_idx, col_idx, values = entries['row'], entries['col'], entries['val']
+    
+    # Track statistics for reporting
+    total_entries = len(entries)
+    in_bounds = (row_idx >= 0) & (row_idx < rows) & (col_idx >= 0) & (col_idx < cols)
+    skipped = np.flatnonzero(~in_bounds)
+    skipped_entries = len(skipped)
+    
+    shown = skipped[:MAX_SKIP_WARNINGS]
+    for idx, row, col in zip(shown.tolist(), row_idx[shown].tolist(), col_idx[shown].tolist()):
+        print(f"⚠️ Skipping out-of-bounds index at line {idx + 3}: ({row}, {col}) - valid range is (0-{rows-1}, 0-{cols-1})")
+    if skipped_entries > len(shown):
+        print(f"⚠️ ... {skipped_entries - len(shown)} more out-of-bounds indices not shown")
+
     # Report summary of skipped entries
     if skipped_entries > 0:
         print(f"\nSummary of skipped entries:")
         print(f"Total entries processed: {total_entries}")
         print(f"Entries skipped due to out-of-bounds indices: {skipped_entries} ({skipped_entries/total_entries*100:.2f}%)")
         
-        # Report most common out-of-bounds patterns
+        # Report most common out-of-bounds patterns, ties in order of first appearance
+        bad_rows, bad_cols = row_idx[skipped], col_idx[skipped]
+        patterns, first_seen, counts = np.unique(
+            np.stack([bad_rows, bad_cols], axis=1), axis=0, return_index=True, return_counts=True)
+        top = np.lexsort((first_seen, -counts))[:5]
         print("\nMost common out-of-bounds patterns:")
-        for pattern, count in sorted(out_of_bounds_indices.items(), key=lambda x: x[1], reverse=True)[:5]:
-            print(f"  {pattern}: {count} occurrences")
+        for (row, col), count in zip(patterns[top].tolist(), counts[top].tolist()):
+            print(f"  ({row}, {col}): {count} occurrences")
             
         # Suggest possible fixes
-        if any(f"({row}, {cols})" in out_of_bounds_indices for row in range(rows)):
+        if np.any((bad_cols == cols) & (bad_rows >= 0) & (bad_rows < rows)):
             print("\nSuggestion: Some indices appear to use 1-based indexing for columns.")
             print("Consider adjusting column indices by subtracting 1 from each column value.")
 
-    return matrix
+    values = values[in_bounds]
+    return SparseMatrix.from_arrays(rows, cols, row_idx[in_bounds], col_idx[in_bounds], values,
+                                    dtype=narrow_dtype(values))
+
+def sorted_entries(matrix: SparseMatrix):
+    """Iterate over the non-zero entries as (row, col, value) in (row, col) order"""
+    rows, cols, vals = matrix.to_sorted().as_arrays()
+    return zip(rows.tolist(), cols.tolist(), vals.tolist())
 
 def write_matrix_to_file(matrix: SparseMatrix, file_path: str):
     """Write matrix in text format"""
     # Write matrix to file in the standard format
-    # First writes dimensions, then each non-zero entry
+    # First writes dimensions, then each non-zero entry in (row, col) order
     with open(file_path, 'w') as f:
         f.write(f"rows={matrix.rows}\ncols={matrix.cols}\n")
-        for (row, col), val in sorted(matrix.items()):
-            f.write(f"({row}, {col}, {val})\n")
+        f.write("".join(f"({row}, {col}, {val})\n" for row, col, val in sorted_entries(matrix)))
 
 def write_matrix_to_json(matrix, file_path):
     """
     Writes a sparse matrix to a JSON file.
     
+    Entries are written as [row, col, value] triples. Uses orjson when it
+    is installed and the standard json module otherwise.
+    
     Args:
         matrix: The sparse matrix object
         file_path: Path to save the JSON file
     """
-    import json
-    
     # Create a dictionary representation of the matrix
     # Includes dimensions and all non-zero entries
+    rows, cols, vals = matrix.as_arrays()
     data = {
         "rows": matrix.rows,
         "cols": matrix.cols,
-        "entries": [
-            {"row": row, "col": col, "value": val}
-            for (row, col), val in matrix.items()
-        ]
+        "entries": list(zip(rows.tolist(), cols.tolist(), vals.tolist()))
     }
     
     # Write the JSON data to the specified file
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=2)
\ No newline at end of file
+    if orjson is not None:
+        with open(file_path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(file_path, 'w') as f:
+            json.dump(data, f, indent=2)
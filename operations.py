@@ -1,60 +1,192 @@
+import numpy as np
 from matrix_core import SparseMatrix
+import kernels
 
-def check_dimensions(a, b, operation):
-    # Validate matrix dimensions for the requested operation
-    # Addition/subtraction require matching dimensions
-    # Multiplication requires inner dimensions to match (cols of A = rows of B)
-    if operation in ('add', 'subtract'):
-        if a.rows != b.rows or a.cols != b.cols:
-            raise ValueError("Matrix dimensions must match for addition or subtraction.")
-    elif operation == 'multiply':
-        if a.cols != b.rows:
-            raise ValueError("Matrix A columns must equal Matrix B rows for multiplication.")
+# Compiled kernels built by setup.py are preferred when present
+try:
+    import _sparse_ops
+except ImportError:
+    _sparse_ops = None
+
+# SciPy's sparse routines take over for large operands when it is installed
+# but neither compiled kernel is: once its output is brought back into
+# sorted (row, col) order it is no faster than those kernels, but it is far
+# faster than the NumPy fallbacks
+try:
+    import scipy.sparse
+    _HAS_SCIPY = True
+except ImportError:
+    _HAS_SCIPY = False
+SCIPY_MIN_NNZ = 10_000
+
+def _use_scipy(a, b):
+    # Whether to delegate an operation on a and b to SciPy
+    if _sparse_ops is not None or kernels.HAS_NUMBA:
+        return False
+    return _HAS_SCIPY and len(a) + len(b) > SCIPY_MIN_NNZ
+
+def _to_scipy(m):
+    # Operate in double precision whatever the stored value dtype
+    return m.to_scipy().astype(np.float64, copy=False)
+
+def _combine(a, b, sign):
+    # Compute a + sign * b
+    if _use_scipy(a, b):
+        if sign > 0:
+            return SparseMatrix.from_scipy(_to_scipy(a) + _to_scipy(b))
+        return SparseMatrix.from_scipy(_to_scipy(a) - _to_scipy(b))
+    
+    # With a compiled kernel (C extension or Numba), both operands are
+    # brought into (row, col) order and merged in one linear pass; large
+    # operands are merged in parallel blocks when Numba has several threads
+    # (on one thread the blocked merge only adds a copy)
+    if _sparse_ops is not None or kernels.HAS_NUMBA:
+        if (kernels.HAS_NUMBA and kernels.N_THREADS > 1
+                and len(a) + len(b) >= kernels.PARALLEL_MERGE_MIN_NNZ):
+            merge_add = kernels.merge_add_parallel
+        elif _sparse_ops is not None:
+            merge_add = _sparse_ops.merge_add
+        else:
+            merge_add = kernels.merge_add
+        rows, cols, vals = merge_add(*a.to_sorted().as_arrays(), *b.to_sorted().as_arrays(), sign)
+        return SparseMatrix.from_arrays(a.rows, a.cols, rows, cols, vals, canonical=True)
+    
+    # Otherwise use vectorized passes over the sorted operands
+    # Positions are linearized to row * cols + col, giving sorted, unique keys
+    a_rows, a_cols, a_vals = a.to_sorted().as_arrays()
+    b_rows, b_cols, b_vals = b.to_sorted().as_arrays()
+    a_keys = a_rows.astype(np.int64) * a.cols + a_cols
+    b_keys = b_rows.astype(np.int64) * a.cols + b_cols
+    
+    # Split B into entries that land on an entry of A and entries that don't
+    pos = np.searchsorted(a_keys, b_keys)
+    if len(a_keys):
+        in_a = a_keys[np.minimum(pos, len(a_keys) - 1)] == b_keys
     else:
-        raise ValueError("Unknown operation.")
+        in_a = np.zeros(len(b_keys), dtype=bool)
+    
+    # Overlapping entries are summed in place of A's
+    sums = a_vals.astype(np.float64)
+    sums[pos[in_a]] += sign * b_vals[in_a]
+    
+    # The rest of B is slotted in between A's entries: each one lands after
+    # the pos A entries smaller than it and the B entries placed before it
+    b_only = ~in_a
+    b_dest = pos[b_only] + np.arange(np.count_nonzero(b_only))
+    n = len(a_keys) + len(b_dest)
+    keys = np.empty(n, dtype=np.int64)
+    vals = np.empty(n, dtype=np.float64)
+    from_a = np.ones(n, dtype=bool)
+    from_a[b_dest] = False
+    keys[b_dest], vals[b_dest] = b_keys[b_only], sign * b_vals[b_only]
+    keys[from_a], vals[from_a] = a_keys, sums
+    
+    # Drop positions where the entries cancelled out
+    nonzero = vals != 0
+    keys, vals = keys[nonzero], vals[nonzero]
+    return SparseMatrix.from_arrays(a.rows, a.cols, keys // a.cols, keys % a.cols, vals,
+                                    canonical=True)
 
 def add(a, b):
     # Add two sparse matrices
     # First validates dimensions match
     # Creates a new result matrix with same dimensions
     # Efficiently handles sparse matrices by only processing non-zero elements
-    check_dimensions(a, b, 'add')
-    result = SparseMatrix(a.rows, a.cols)
-    for (i, j), val in a.items():
-        result.set(i, j, val)
-    for (i, j), val in b.items():
-        result.set(i, j, result.get(i, j) + val)
-    return result
+    if a.rows != b.rows or a.cols != b.cols:
+        raise ValueError("Matrix dimensions must match for addition or subtraction.")
+    return _combine(a, b, 1)
 
 def subtract(a, b):
     # Subtract matrix b from matrix a
     # First validates dimensions match
     # Creates a new result matrix with same dimensions
     # Efficiently handles sparse matrices by only processing non-zero elements
-    check_dimensions(a, b, 'subtract')
-    result = SparseMatrix(a.rows, a.cols)
-    for (i, j), val in a.items():
-        result.set(i, j, val)
-    for (i, j), val in b.items():
-        result.set(i, j, result.get(i, j) - val)
-    return result
+    if a.rows != b.rows or a.cols != b.cols:
+        raise ValueError("Matrix dimensions must match for addition or subtraction.")
+    return _combine(a, b, -1)
+
+def _spgemm_numpy(a_indptr, a_indices, a_data, b_indptr, b_indices, b_data, n_cols):
+    # NumPy version of kernels.spgemm, used when Numba is not installed
+    # Each output row is scattered into a dense accumulator, so no per-entry
+    # hashing is needed; the accumulator and touched mask are shared by all
+    # rows and only the touched columns are cleared after each one
+    n_rows = len(a_indptr) - 1
+    counts = np.zeros(n_rows, dtype=np.int64)
+    b_data = b_data.astype(np.float64, copy=False)  # Accumulate in double precision
+    acc = np.zeros(n_cols, dtype=np.float64)
+    touched = np.zeros(n_cols, dtype=bool)
+    out_cols, out_vals = [], []
+    for i in np.flatnonzero(np.diff(a_indptr)):
+        for kp in range(a_indptr[i], a_indptr[i + 1]):
+            k = a_indices[kp]
+            lo, hi = b_indptr[k], b_indptr[k + 1]
+            if lo == hi:  # Row k of B has no non-zero elements
+                continue
+            cols = b_indices[lo:hi]
+            acc[cols] += a_data[kp] * b_data[lo:hi]
+            touched[cols] = True
+        cols = np.flatnonzero(touched)
+        counts[i] = len(cols)
+        out_cols.append(cols)
+        out_vals.append(acc[cols])
+        acc[cols] = 0
+        touched[cols] = False
+    
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    if not out_vals:
+        return indptr, np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+    return indptr, np.concatenate(out_cols), np.concatenate(out_vals)
+
+def _scale_rows(a, b_indptr, b_indices, b_data, n_cols):
+    # Multiply when every row of A has at most one non-zero element
+    # Output row i is then row k of B scaled by A[i, k], so the product is a
+    # single vectorized gather; rows of A are unique and sorted, and each row
+    # of B is sorted by column, so the result comes out in canonical order
+    a_rows, a_cols, a_vals = a.as_arrays()
+    counts = b_indptr[a_cols + 1] - b_indptr[a_cols]
+    # Index into B's arrays of every output entry: each run of counts[e]
+    # consecutive entries starts at b_indptr[a_cols[e]]
+    run_starts = np.cumsum(counts) - counts
+    positions = np.repeat(b_indptr[a_cols] - run_starts, counts) + np.arange(counts.sum())
+    
+    rows = np.repeat(a_rows, counts)
+    vals = np.repeat(a_vals.astype(np.float64), counts) * b_data[positions]
+    nonzero = vals != 0
+    return SparseMatrix.from_arrays(a.rows, n_cols, rows[nonzero], b_indices[positions][nonzero],
+                                    vals[nonzero], canonical=True)
 
 def multiply(a, b):
-    # Optimize multiplication for sparse matrices
-    check_dimensions(a, b, 'multiply')
-    result = SparseMatrix(a.rows, b.cols)
-    
-    # Create column-indexed structure for matrix B to avoid scanning all columns
-    b_cols = {}
-    for (row, col), val in b.items():
-        if row not in b_cols:
-            b_cols[row] = {}
-        b_cols[row][col] = val
-    
-    # Perform multiplication using the optimized structure
-    for (i, k), val_a in a.items():
-        if k in b_cols:  # Only process if row k in B has non-zero elements
-            for j, val_b in b_cols[k].items():
-                result.set(i, j, result.get(i, j) + val_a * val_b)
-    
-    return result
+    # Multiply row by row (Gustavson's algorithm) over CSR forms of A and B
+    # Uses the C extension if built, else the Numba kernel; large products
+    # go to SciPy before falling back to NumPy
+    # Inner dimensions must match (cols of A = rows of B)
+    if a.cols != b.rows:
+        raise ValueError("Matrix A columns must equal Matrix B rows for multiplication.")
+    if _use_scipy(a, b):
+        return SparseMatrix.from_scipy(_to_scipy(a) @ _to_scipy(b))
+    
+    b_csr = b.to_csr()
+    b_row_nnz = np.diff(b_csr[0])
+    
+    # When most rows of B are empty, drop the entries of A that would only
+    # meet those rows before doing any per-entry work
+    if np.count_nonzero(b_row_nnz) < a.cols / 8:
+        rows, cols, vals = a.to_sorted().as_arrays()
+        keep = b_row_nnz[cols] > 0
+        a = SparseMatrix.from_arrays(a.rows, a.cols, rows[keep], cols[keep], vals[keep],
+                                     canonical=True, dtype=vals.dtype)
+    
+    # At most one non-zero element per row of A: scale rows of B directly
+    rows = a.to_sorted().as_arrays()[0]
+    if np.all(rows[1:] != rows[:-1]):
+        return _scale_rows(a, *b_csr, b.cols)
+    
+    if _sparse_ops is not None:
+        spgemm = _sparse_ops.spgemm
+    elif kernels.HAS_NUMBA:
+        spgemm = kernels.spgemm
+    else:
+        spgemm = _spgemm_numpy
+    indptr, indices, data = spgemm(*a.to_csr(), *b_csr, b.cols)
+    return SparseMatrix.from_csr(a.rows, b.cols, indptr, indices, data)
@@ -0,0 +1,22 @@
+"""
+Builds the optional compiled kernels (_sparse_ops) in place:
+
+    python setup.py build_ext --inplace
+
+The calculator runs without them, using Numba or NumPy instead.
+"""
+from setuptools import Extension, setup
+from Cython.Build import cythonize
+
+extensions = [
+    Extension(
+        "_sparse_ops",
+        ["_sparse_ops.pyx"],
+        extra_compile_args=["-O3", "-march=native"],
+    )
+]
+
+setup(
+    name="sparse-matrix-calculator",
+    ext_modules=cythonize(extensions),
+)